@@ -1,10 +1,9 @@
 import argparse
-import copy
 import json
 import os
 import warnings
 from pathlib import Path
-from typing import Dict, Tuple
+from typing import Dict, Optional, Tuple
 
 import numpy as np
 import torch
@@ -46,7 +45,11 @@ parser.add_argument(
 parser.add_argument("--use_shallow", action="store_true", default=True)
 parser.add_argument("--no-use_shallow", dest="use_shallow", action="store_false")
 parser.add_argument("--max_steps_per_epoch", type=int, default=2000)
+# Number of dst nodes scored at once during evaluation
+parser.add_argument("--eval_dst_chunk_size", type=int, default=65536)
 parser.add_argument("--num_workers", type=int, default=0)
+# Trade float32 matmul precision for speed on Ampere and newer GPUs
+parser.add_argument("--tf32", action="store_true", default=False)
 parser.add_argument("--seed", type=int, default=42)
 parser.add_argument(
     "--cache_dir",
@@ -58,6 +61,9 @@ args = parser.parse_args()
 device = torch.device("cuda" if torch.cuda.is_available() else "cpu")
 if torch.cuda.is_available():
     torch.set_num_threads(1)
+    if args.tf32:
+        # Allow TF32 matmuls on Ampere+:
+        torch.set_float32_matmul_precision("high")
 seed_everything(args.seed)
 
 dataset: Dataset = get_dataset(args.dataset, download=True)
@@ -104,6 +110,9 @@ train_loader = LinkNeighborLoader(
     # if share_same_time is True, we use sampler, so shuffle must be set False
     shuffle=not args.share_same_time,
     num_workers=args.num_workers,
+    persistent_workers=args.num_workers > 0,
+    # Only pin with workers, where pinning happens off the main thread.
+    pin_memory=torch.cuda.is_available() and args.num_workers > 0,
 )
 
 eval_loaders_dict: Dict[str, Tuple[NeighborLoader, NeighborLoader]] = {}
@@ -123,6 +132,7 @@ for split in ["val", "test"]:
         batch_size=args.batch_size,
         shuffle=False,
         num_workers=args.num_workers,
+        persistent_workers=args.num_workers > 0,
     )
     dst_loader = NeighborLoader(
         data,
@@ -135,6 +145,7 @@ for split in ["val", "test"]:
         batch_size=args.batch_size,
         shuffle=False,
         num_workers=args.num_workers,
+        persistent_workers=args.num_workers > 0,
     )
     eval_loaders_dict[split] = (src_loader, dst_loader)
 
@@ -154,15 +165,17 @@ optimizer = torch.optim.Adam(model.parameters(), lr=args.lr)
 def train() -> float:
     model.train()
 
-    loss_accum = count_accum = 0
+    # Accumulate the loss on the device to avoid a host sync every step.
+    loss_accum = torch.zeros((), device=device)
+    count_accum = 0
     steps = 0
     total_steps = min(len(train_loader), args.max_steps_per_epoch)
     for batch in tqdm(train_loader, total=total_steps):
         src_batch, batch_pos_dst, batch_neg_dst = batch
         src_batch, batch_pos_dst, batch_neg_dst = (
-            src_batch.to(device),
-            batch_pos_dst.to(device),
-            batch_neg_dst.to(device),
+            src_batch.to(device, non_blocking=True),
+            batch_pos_dst.to(device, non_blocking=True),
+            batch_neg_dst.to(device, non_blocking=True),
         )
         x_src = model(src_batch, task.src_entity_table)
         x_pos_dst = model(batch_pos_dst, task.dst_entity_table)
@@ -185,7 +198,7 @@ def train() -> float:
         loss.backward()
         optimizer.step()
 
-        loss_accum += float(loss) * x_src.size(0)
+        loss_accum += loss.detach() * x_src.size(0)
         count_accum += x_src.size(0)
 
         steps += 1
@@ -200,7 +213,7 @@ def train() -> float:
             f"issues with deeper nets, decrease the batch size."
         )
 
-    return loss_accum / count_accum if count_accum > 0 else float("nan")
+    return loss_accum.item() / count_accum if count_accum > 0 else float("nan")
 
 
 @torch.no_grad()
@@ -219,9 +232,25 @@ def test(src_loader: NeighborLoader, dst_loader: NeighborLoader) -> np.ndarray:
     for batch in tqdm(src_loader):
         batch = batch.to(device)
         emb = model(batch, task.src_entity_table)
-        _, pred_index_mat = torch.topk(emb @ dst_emb.t(), k=task.eval_k, dim=1)
-        pred_index_mat_list.append(pred_index_mat.cpu())
-    pred = torch.cat(pred_index_mat_list, dim=0).numpy()
+        # Keep a running top-k over chunks of dst nodes so that the full
+        # [batch_size, num_dst_nodes] score matrix is never materialized.
+        topk_score: Optional[Tensor] = None
+        topk_index: Optional[Tensor] = None
+        offset = 0
+        for dst_chunk in dst_emb.split(args.eval_dst_chunk_size):
+            k = min(task.eval_k, dst_chunk.size(0))
+            score, index = torch.topk(emb @ dst_chunk.t(), k=k, dim=1)
+            index += offset
+            offset += dst_chunk.size(0)
+            if topk_score is not None:
+                score = torch.cat([topk_score, score], dim=1)
+                index = torch.cat([topk_index, index], dim=1)
+                k = min(task.eval_k, score.size(1))
+                score, perm = torch.topk(score, k=k, dim=1)
+                index = index.gather(1, perm)
+            topk_score, topk_index = score, index
+        pred_index_mat_list.append(topk_index)
+    pred = torch.cat(pred_index_mat_list, dim=0).cpu().numpy()
     return pred
 
 
@@ -229,7 +258,7 @@ state_dict = None
 best_val_metric = 0
 for epoch in range(1, args.epochs + 1):
     train_loss = train()
-    if epoch % args.eval_epochs_interval == 0:
+    if epoch % args.eval_epochs_interval == 0 or epoch == args.epochs:
         val_pred = test(*eval_loaders_dict["val"])
         val_metrics = task.evaluate(val_pred, task.get_table("val"))
         print(
@@ -239,7 +268,20 @@ for epoch in range(1, args.epochs + 1):
 
         if val_metrics[tune_metric] >= best_val_metric:
             best_val_metric = val_metrics[tune_metric]
-            state_dict = copy.deepcopy(model.state_dict())
+            if state_dict is None:
+                # Allocate CPU buffers for the best model weights once, so that
+                # each improvement copies into them rather than deep-copying the
+                # whole model (including the shallow dst embedding table).
+                state_dict = {
+                    key: torch.empty(
+                        value.size(),
+                        dtype=value.dtype,
+                        pin_memory=torch.cuda.is_available(),
+                    )
+                    for key, value in model.state_dict().items()
+                }
+            for key, value in model.state_dict().items():
+                state_dict[key].copy_(value, non_blocking=True)
 
 
 model.load_state_dict(state_dict)
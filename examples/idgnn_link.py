@@ -195,7 +195,7 @@ state_dict = None
 best_val_metric = 0
 for epoch in range(1, args.epochs + 1):
     train_loss = train()
-    if epoch % args.eval_epochs_interval == 0:
+    if epoch % args.eval_epochs_interval == 0 or epoch == args.epochs:
         val_pred = test(loader_dict["val"])
         val_metrics = task.evaluate(val_pred, task.get_table("val"))
         print(
@@ -90,7 +90,7 @@ def make_pkey_fkey_graph(
             mask = ~pkey_index.isna()
             fkey_index = torch.arange(len(pkey_index))
             # Filter dangling foreign keys:
-            pkey_index = torch.from_numpy(pkey_index[mask].astype(int).values)
+            pkey_index = torch.from_numpy(pkey_index[mask].to_numpy(dtype=np.int64))
             fkey_index = fkey_index[torch.from_numpy(mask.values)]
             # Ensure no dangling fkeys
             assert (pkey_index < len(db.table_dict[pkey_table_name])).all()
@@ -150,7 +150,9 @@ def get_node_train_table_input(
 ) -> NodeTrainTableInput:
     r"""Get the training table input for node prediction."""
 
-    nodes = torch.from_numpy(table.df[task.entity_col].astype(int).values)
+    nodes = torch.from_numpy(
+        table.df[task.entity_col].to_numpy(dtype=np.int64, copy=True)
+    )
 
     time: Optional[Tensor] = None
     if table.time_col is not None:
@@ -203,12 +205,16 @@ def get_link_train_table_input(
     r"""Get the training table input for link prediction."""
 
     src_node_idx: Tensor = torch.from_numpy(
-        table.df[task.src_entity_col].astype(int).values
+        table.df[task.src_entity_col].to_numpy(dtype=np.int64, copy=True)
     )
     exploded = table.df[task.dst_entity_col].explode()
-    coo_indices = torch.from_numpy(
-        np.stack([exploded.index.values, exploded.values.astype(int)])
-    )
+    # Cast the exploded (object-typed) values straight into an int64 buffer to
+    # avoid the intermediate copies of astype() and np.stack():
+    coo_indices = np.empty((2, len(exploded)), dtype=np.int64)
+    coo_indices[0] = exploded.index.values
+    coo_indices[1] = exploded.values
+    del exploded
+    coo_indices = torch.from_numpy(coo_indices)
     sparse_coo = torch.sparse_coo_tensor(
         coo_indices,
         torch.ones(coo_indices.size(1), dtype=bool),